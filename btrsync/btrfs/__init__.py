@@ -10,8 +10,8 @@ Data structures and functions manipulating btrfs subvolumes.
 """
 
 import posixpath
-import pathlib
 
+from collections import deque
 from collections import defaultdict
 
 from .. import util
@@ -26,11 +26,11 @@ class Vol(dict):
 	Helper class for manipulating btrfs subvolumes.
 
 	Subvolumes are :class:`dict` instances of (property: value) pairs.
-	The properties exposed are those provided by ``btrfs subvolume list``
-	with the addition of computed COW parent and successors.
+	The properties exposed are those provided by ``btrfs subvolume list``;
+	the computed COW parent and successors are kept as slot attributes,
+	outside the property dict.
 	"""
-	_P = '_cowpreq'
-	_S = '_cowsucc'
+	__slots__ = ('_parent', '_succs', '_chld', '_check')
 
 	def __init__(self, *args, parent=None, succs=[], **kwargs):
 		super().__init__(*args, **kwargs)
@@ -40,19 +40,19 @@ class Vol(dict):
 	@property
 	def parent(self):
 		"""COW parent of this subvolume, or :const:`None` if self-standing."""
-		return self[self._P]
+		return self._parent
 	@parent.setter
 	def parent(self, v):
-		self[self._P] = v
+		self._parent = v
 
 	@property
 	def succs(self):
 		"""Volumes for which this subvolume is a COW parent."""
 		try:
-			return self[self._S]
-		except KeyError:
-			self[self._S] = []
-			return self[self._S]
+			return self._succs
+		except AttributeError:
+			self._succs = []
+			return self._succs
 
 
 class COWTree:
@@ -61,10 +61,13 @@ class COWTree:
 
 	:param subvols: the sequence of subvolumes (:class:`dict` instances keyed by subvolume properties) to process
 	:param check: a function that takes a subvolume as argument and returns a boolean whether to consider it for parentage; by default accept all
+	:param check_cache: optional :class:`dict` mapping subvolume uuids to `check` results;
+		consulted before invoking `check` and updated with fresh results,
+		allowing repeated tree builds over overlapping subvolume sets to skip the callback
 	"""
-	def __init__(self, subvols, check=None):
+	def __init__(self, subvols, check=None, *, check_cache=None):
 		def _finish(vol):
-			if vol['_check']:
+			if vol._check:
 				pq = vol.parent
 				if pq is None:
 					self._roots.append(vol)
@@ -72,65 +75,80 @@ class COWTree:
 					pq.succs.append(vol)
 
 		def _handle_preq(pq):
-			for vol in preq_waitlist[pq['uuid']]:
-				vol.parent = pq.parent
-				_handle_preq(vol)
-				_finish(vol)
-			del preq_waitlist[pq['uuid']]
+			stack = [pq]
+			while stack:
+				pq = stack.pop()
+				for vol in preq_waitlist.pop(pq['uuid'], ()):
+					vol.parent = pq.parent
+					_finish(vol)
+					stack.append(vol)
 
 		def _handle_sibtree(vol, *sibs, maxdepth=0):
-			for sib in util.bfs(lambda v: reversed(v['_chld']), *reversed(sibs), maxdepth=maxdepth):
-				if sib['_check']:
+			for sib in util.bfs(lambda v: v._chld, *reversed(sibs), maxdepth=maxdepth):
+				if sib._check:
 					vol.parent = sib
 					return True
 			return False
 
 		def _handle_par(vol, par):
 			r = True
-			if not _handle_sibtree(vol, par, maxdepth=1):
-				try:
-					vol.parent = par.parent
-				except KeyError:
-					r = False
-			par['_chld'].append(vol)
+			if par._check:
+				vol.parent = par
+			else:
+				for sib in par._chld:
+					if sib._check:
+						vol.parent = sib
+						break
+				else:
+					try:
+						vol.parent = par.parent
+					except AttributeError:
+						r = False
+			par._chld.appendleft(vol)
 			return r
 
 		def _handle_parwait(par):
 			uid = par['uuid']
-			for orph in parent_waitlist[uid]:
+			for orph in parent_waitlist.pop(uid, ()):
 				if _handle_par(orph, par):
 					_handle_preq(orph)
 					_finish(orph)
 				else:
-					preq_waitlist[uid].append(orph)
-			del parent_waitlist[uid]
+					preq_waitlist.setdefault(uid, []).append(orph)
 
-		parent_waitlist = defaultdict(list)
-		preq_waitlist = defaultdict(list)
+		parent_waitlist = {}
+		preq_waitlist = {}
 
-		self.vols = {}
+		self.vols = vols = {}
 		self._roots = []
 
-		_check = (lambda v: True) if check is None else check
-
 		for volume in subvols:
 			vol = Vol(volume)
-			vol['_check'] = _check(vol)
-			vol['_chld'] = []
+			uid = vol['uuid']
+			if check is None:
+				vol._check = True
+			elif check_cache is None:
+				vol._check = check(vol)
+			else:
+				try:
+					vol._check = check_cache[uid]
+				except KeyError:
+					vol._check = check_cache[uid] = check(vol)
+			vol._chld = deque()
 
 			puid = vol['parent_uuid']
 			if puid is None:
 				vol.parent = None
 				_finish(vol)
-			elif puid in self.vols:
-				if _handle_par(vol, self.vols[puid]):
+			elif puid in vols:
+				if _handle_par(vol, vols[puid]):
 					_handle_preq(vol)
 					_finish(vol)
 				else:
-					preq_waitlist[puid].append(vol)
+					preq_waitlist.setdefault(puid, []).append(vol)
 			else:
-				parent_waitlist[puid].append(vol)
-			self.vols[vol['uuid']] = vol
+				parent_waitlist.setdefault(puid, []).append(vol)
+			vols[uid] = vol
 			_handle_parwait(vol)
 
 		for par, orphans in parent_waitlist.items():
@@ -165,6 +183,16 @@ class COWTree:
 			yield node
 			node = node.parent
 
+	@staticmethod
+	def ancestors_list(node):
+		"""Return the COW ancestors of `node`, including itself, as a list; faster than materializing :meth:`ancestors`."""
+		out = []
+		append = out.append
+		while node is not None:
+			append(node)
+			node = node.parent
+		return out
+
 	@staticmethod
 	def diff(aroots, broots, akeys, bkeys):
 		"""
@@ -183,59 +211,83 @@ class COWTree:
 		comb = defaultdict(list)
 		agrp = util.group(COWTree.bfs(*aroots), *akeys)
 		bgrp = util.group(COWTree.bfs(*broots), *bkeys)
+		bjoin = {}
+		for bg in bgrp:
+			for bk, bvols in bg.items():
+				if bk is not None:
+					bjoin.setdefault(bk, []).extend(bvols)
 		for ag in agrp:
-			for ak in ag:
-				if ak is not None:
-					for bg in bgrp:
-						if ak in bg:
-							for avol in ag[ak]:
-								coma[avol['uuid']].extend(bg[ak])
-							for bvol in bg[ak]:
-								comb[bvol['uuid']].extend(ag[ak])
+			for ak, avols in ag.items():
+				bvols = bjoin.get(ak) if ak is not None else None
+				if bvols:
+					for avol in avols:
+						coma[avol['uuid']].extend(bvols)
+					for bvol in bvols:
+						comb[bvol['uuid']].extend(avols)
 		return coma, comb
 
 
-def abspaths(vols, rootpath):
+def abspaths(vols, rootpath, *, inplace=False):
 	"""
 	Process a sequence of btrfs volumes, making all relative paths absolute; absolute paths are left unchanged.
 
 	:param vols: the sequence of btrfs subvolumes to process
 	:param rootpath: the absolute path that subvolume paths are relative to
+	:param inplace: if :const:`True`, modify the input subvolumes instead of yielding copies;
+		safe when the caller does not retain the unmodified inputs
 	:returns: iterator over the modified subvolumes
 	:raises ValueError: if `rootpath` is not absolute (does not start with :data:`.FSTREE`)
 	"""
 	if not rootpath.startswith(FSTREE):
 		raise ValueError(f'Root path must start with {FSTREE}')
+	heads = []
+	head, tail = rootpath, ''
+	while head and head != FSTREE:
+		head, base = posixpath.split(head)
+		tail = posixpath.join(base, tail) if tail else base
+		heads.append((head, tail, tail + '/', len(tail) + 1))
+	fslen = len(FSTREE)
 	for v in vols:
 		vp = v['path']
-		if vp.startswith(FSTREE):
+		if vp[:fslen] == FSTREE:
 			yield v
 		else:
-			nv = v.copy()
-			nv['path'] = util.path_merge(rootpath, vp, root=FSTREE, path=posixpath)
+			nv = v if inplace else v.copy()
+			for head, tail, tpre, tlen in heads:
+				if vp == tail or vp[:tlen] == tpre:
+					nv['path'] = posixpath.join(head, vp)
+					break
+			else:
+				nv['path'] = posixpath.join(rootpath, vp)
 			yield nv
 
-def relpaths(vols, rootpath):
+def relpaths(vols, rootpath, *, inplace=False):
 	"""
 	Process a sequence of btrfs volumes, making all paths below a chosen root relative to that root; other paths are left unchanged.
 
 	:param vols: the sequence of btrfs subvolumes to process
 	:param rootpath: the absolute path that subvolume paths are to be made relative to
+	:param inplace: if :const:`True`, modify the input subvolumes instead of yielding copies;
+		safe when the caller does not retain the unmodified inputs
 	:returns: iterator over the modified subvolumes
 	:raises ValueError: if `rootpath` is not absolute (does not start with :data:`.FSTREE`)
 	"""
 	if not rootpath.startswith(FSTREE):
 		raise ValueError(f'Root path must start with {FSTREE}')
-	relparts = pathlib.PurePosixPath(rootpath).parts[1:]
-	relrootpath = posixpath.join(*relparts) if relparts else ''
+	relrootpath = rootpath[len(FSTREE):].lstrip('/')
+	rplen = len(rootpath)
+	fslen = len(FSTREE)
 	for v in vols:
 		vp = v['path']
-		if vp.startswith(rootpath):
-			nv = v.copy()
-			nv['path'] = posixpath.relpath(vp, rootpath)
+		if vp[:rplen] == rootpath:
+			nv = v if inplace else v.copy()
+			if len(vp) > rplen and vp[rplen] == '/':
+				nv['path'] = vp[rplen + 1:]
+			else:
+				nv['path'] = posixpath.relpath(vp, rootpath)
 			yield nv
-		elif relrootpath and not vp.startswith(FSTREE):
-			nv = v.copy()
+		elif relrootpath and not vp[:fslen] == FSTREE:
+			nv = v if inplace else v.copy()
 			nv['path'] = posixpath.relpath(vp, relrootpath)
 			yield nv
 		else:
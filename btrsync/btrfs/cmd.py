@@ -14,6 +14,10 @@ import itertools
 from .. import util
 
 
+_LIST_FIELDS = frozenset('pcguqR')
+"""Subvolume fields supported by :func:`.list`."""
+
+
 def list(path, *, list_all=False, readonly=False, fields='pcguqR'):
 	"""
 	Generate a ``btrfs subvolume list`` command.
@@ -26,18 +30,15 @@ def list(path, *, list_all=False, readonly=False, fields='pcguqR'):
 	:returns: :class:`btrsync.util.Cmd` instance of the desired btrfs list command
 	:raises ValueError: if unsupported fields are supplied
 	"""
-	FIELDS = 'pcguqR'
-	for f in fields:
-		if f not in FIELDS:
-			raise ValueError(f"Unknown field `{f}'; allowed fields are: {', '.join(FIELDS)}")
-	args = ['subvolume', 'list', '-t']
-	args.append('-a' if list_all else '-o')
+	bad = set(fields) - _LIST_FIELDS
+	if bad:
+		raise ValueError(f"Unknown field(s) `{''.join(sorted(bad))}'; allowed fields are: {', '.join(sorted(_LIST_FIELDS))}")
+	args = ('subvolume', 'list', '-t', '-a' if list_all else '-o')
 	if readonly:
-		args.append('-r')
+		args += ('-r',)
 	if fields:
-		args.append('-' + fields)
-	args.append(path)
-	return util.Cmd('btrfs', args)
+		args += ('-' + fields,)
+	return util.Cmd('btrfs', args + (path,))
 
 
 def send(*paths, parent=None, clones=[], keep_compressed=False):
@@ -53,15 +54,14 @@ def send(*paths, parent=None, clones=[], keep_compressed=False):
 	"""
 	if not paths:
 		raise ValueError('Must specify at least one path to send')
-	args = ['send']
+	args = ('send',)
 	if keep_compressed:
-		args.append('--compressed-data')
+		args += ('--compressed-data',)
 	if parent is not None:
-		args.extend(('-p', parent))
+		args += ('-p', parent)
 	if clones:
-		args.extend(itertools.chain.from_iterable(('-c', cl) for cl in clones))
-	args.extend(paths)
-	return util.Cmd('btrfs', args)
+		args += tuple(itertools.chain.from_iterable(('-c', cl) for cl in clones))
+	return util.Cmd('btrfs', args + paths)
 
 
 def receive(path, *, force_decompress=False):
@@ -72,10 +72,7 @@ def receive(path, *, force_decompress=False):
 	:param force_decompress: if :const:`True`, force the decompression of any compressed blocks in the stream (btrfs-receive option ``--force-decompress``)
 	:returns: :class:`btrsync.util.Cmd` instance of the desired btrfs receive command
 	"""
-	args = ['receive']
-	if force_decompress:
-		args.append('--force-decompress')
-	args.append(path)
+	args = ('receive', '--force-decompress', path) if force_decompress else ('receive', path)
 	return util.Cmd('btrfs', args)
 
 
@@ -91,10 +88,9 @@ def show(path, *, uuid=None, rootid=None):
 	"""
 	if uuid is not None and rootid is not None:
 		raise ValueError("At most one of `uuid' and `rootid' may be specified")
-	args = ['subvolume', 'show']
+	args = ('subvolume', 'show')
 	if uuid is not None:
-		args.extend(('-u', uuid))
+		args += ('-u', uuid)
 	elif rootid is not None:
-		args.extend(('-r', rootid))
-	args.append(path)
-	return util.Cmd('btrfs', args)
+		args += ('-r', rootid)
+	return util.Cmd('btrfs', args + (path,))
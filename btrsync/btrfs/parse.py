@@ -10,7 +10,7 @@ Parsers for the output of ``btrfs`` subcommands.
 """
 
 
-def _tabsplit(line): return (x.strip() for x in line.split('\t') if x)
+def _tabsplit(line): return [x.strip() for x in line.split('\t') if x]
 def _valid(v): return None if v == '-' else v
 
 
@@ -27,13 +27,20 @@ class _BaseParser:
 
 class List(_BaseParser):
 	"""Parse the `lines` of output of ``btrfs subvolume list -t ...`` into an iterable of :class:`dict` instances describing subvolumes."""
+	_DEDUP_COLS = frozenset(('uuid', 'parent_uuid', 'received_uuid'))
+
 	def __iter__(self):
 		it = iter(self.lines)
-		hdrs = list(_tabsplit(next(it)))
+		hdrs = _tabsplit(next(it))
 		line = next(it)
 		if not line.startswith('-'):
 			raise ValueError(f"Expected separator on line 2, got `{line}'")
-		yield from (dict(zip(hdrs, (_valid(v) for v in _tabsplit(line)))) for line in it)
+		cache = {}
+		def _dedup(v):
+			return None if v == '-' else cache.setdefault(v, v)
+		transforms = [_dedup if h in self._DEDUP_COLS else _valid for h in hdrs]
+		for line in it:
+			yield dict(zip(hdrs, [t(v) for t, v in zip(transforms, _tabsplit(line))]))
 
 
 class Show(_BaseParser):
@@ -44,20 +51,20 @@ class Show(_BaseParser):
 		yield path
 
 		stats = {}
-		ml = None
 		for line in it:
 			k, *v = _tabsplit(line)
-			if not v:
-				if ml is None:
-					mlk = k
-					ml = []
-				else:
-					ml.append(k)
+			if v:
+				stats[k] = _valid(' '.join(v))
 			else:
-				if ml is not None:
+				mlk, ml = k, []
+				for line in it:
+					k, *v = _tabsplit(line)
+					if not v:
+						ml.append(k)
+					else:
+						stats[mlk] = ml
+						stats[k] = _valid(' '.join(v))
+						break
+				else:
 					stats[mlk] = ml
-					ml = None
-				stats[k] = _valid(' '.join(v))
-		if ml is not None:
-			stats[mlk] = ml
 		yield stats
@@ -11,6 +11,7 @@ import re
 import os
 import sys
 import fnmatch
+import functools
 import posixpath
 import asyncio
 import argparse
@@ -28,6 +29,10 @@ class IncrSync(sync.BtrSync):
 		return parent is not None
 
 
+_BYTES_THRESH = 1024
+_BYTES_UNITS = ('  B', 'KiB', 'MiB', 'GiB', 'TiB', 'EiB')
+_BYTES_SCALE = tuple((1 << (10 * i), u) for i, u in enumerate(_BYTES_UNITS))
+
 def humanbytes(n, sep=' '):
 	"""
 	Represent `n` bytes in human-readable form using IEC units (i.e., KiB, MiB, etc.).
@@ -36,15 +41,10 @@ def humanbytes(n, sep=' '):
 	:param sep: separator between numeric value and unit
 	:returns: human-readable representation as string
 	"""
-	THRESH = 1024
-	UNITS = ('  B', 'KiB', 'MiB', 'GiB', 'TiB', 'EiB')
-	SCALE = [(2**(10*i), u) for i, u in enumerate(UNITS)]
-	def rv(q, u): return sep.join((f'{q:6.1f}', u))
-	for sz, unit in SCALE[:-1]:
-		r = n/sz
-		if abs(r) < THRESH:
-			return rv(r, unit)
-	return rv(n/SCALE[-1][0], SCALE[-1][1])
+	an = int(abs(n))
+	i = min((an.bit_length() - 1) // 10, len(_BYTES_SCALE) - 1) if an else 0
+	sz, unit = _BYTES_SCALE[i]
+	return sep.join((f'{n/sz:6.1f}', unit))
 
 
 class CliProgress(sync.ProgressTransfer):
@@ -53,8 +53,9 @@ class CliProgress(sync.ProgressTransfer):
 		super().__init__(prog_seq='|/-\\', *args, **kwargs)
 
 	async def report_progress(self, total, prev, seq):
-		print('\r', next(seq), humanbytes(total),
-		      humanbytes((total - prev) / self.period) + '/sec', end='')
+		sys.stdout.write(f'\r {next(seq)} {humanbytes(total)} '
+		                 f'{humanbytes((total - prev) / self.period)}/sec')
+		sys.stdout.flush()
 
 
 class BaseMatch:
@@ -66,14 +67,34 @@ class BaseMatch:
 	def __init__(self):
 		self.incl = []
 		self.excl = []
+		self._incl_rx = None
+		self._excl_rx = None
+		self._has_incl = False
+		self._has_excl = False
+
+	@staticmethod
+	def _union(globs):
+		"""Compile `globs` into a single alternation regex matching any of them."""
+		return re.compile('|'.join(f'(?:{fnmatch.translate(g)})' for g in globs))
 
 	def include(self, *globs):
 		"""Add `globs` to the list of included globs."""
 		self.incl.extend(globs)
+		self._incl_rx = None
+		self._has_incl = bool(self.incl)
 
 	def exclude(self, *globs):
 		"""Add `globs` to the list of excluded globs."""
 		self.excl.extend(globs)
+		self._excl_rx = None
+		self._has_excl = bool(self.excl)
+
+	def precompile(self):
+		"""Build the compiled include/exclude patterns via the shared cache, so matchers with identical glob sets reuse the same regex objects."""
+		if self._has_incl:
+			self._incl_rx = _compile_globs(tuple(self.incl))
+		if self._has_excl:
+			self._excl_rx = _compile_globs(tuple(self.excl))
 
 	def base_match(self, path):
 		"""
@@ -86,12 +107,20 @@ class BaseMatch:
 	def match(self, path):
 		"""Return :const:`True` if `path` matches against :func:`base_match` and current includes and excludes, :const:`False` otherwise."""
 		rpath = self.base_match(path)
+		if not (self._has_incl or self._has_excl):
+			return rpath is not None
 		if rpath is None:
 			return False
-		if self.incl and not any(fnmatch.fnmatch(rpath, i) for i in self.incl):
-			return False
-		if any(fnmatch.fnmatch(rpath, x) for x in self.excl):
-			return False
+		if self._has_incl:
+			if self._incl_rx is None:
+				self._incl_rx = self._union(self.incl)
+			if not self._incl_rx.match(rpath):
+				return False
+		if self._has_excl:
+			if self._excl_rx is None:
+				self._excl_rx = self._union(self.excl)
+			if self._excl_rx.match(rpath):
+				return False
 		return True
 
 	def stop(self, paths):
@@ -101,6 +130,20 @@ class BaseMatch:
 		By default always return :const:`False`."""
 		return False
 
+	def match_vol(self, vol):
+		"""Return the result of :func:`match` on the path of subvolume `vol`."""
+		return self.match(vol['path'])
+
+	def stop_vols(self, vols):
+		"""Return the result of :func:`stop` on the paths of subvolumes `vols`."""
+		return self.stop([v['path'] for v in vols])
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_globs(globs):
+	"""Compile a tuple of globs into a single shared alternation regex."""
+	return BaseMatch._union(globs)
+
 
 class SingleMatch(BaseMatch):
 	"""
@@ -137,18 +180,27 @@ class UnderGlob(BaseMatch):
 			raise ValueError('glob must specify a relative path')
 		if not glob.endswith('*'):
 			glob = posixpath.join(glob, '*')
-		rx = fnmatch.translate(glob)
-		assert(rx.endswith('.*)\\Z'))
-		rx = rx[:-len('.*)\\Z')] + '(.*))\\Z'
-		self.under = re.compile(rx)
 		self._glob = glob
-		self._re = rx
+		prefix = glob[:-1]
+		self._prefix = None if any(c in prefix for c in '*?[') else prefix
 
 	def __repr__(self):
 		return f'UnderGlob({self._glob})'
 
+	@functools.cached_property
+	def under(self):
+		"""Compiled regex matching paths below the base glob, capturing the relative remainder; built on first use."""
+		rx = fnmatch.translate(self._glob)
+		star = fnmatch.translate('*')
+		tail = star[star.index('.*'):]
+		assert(rx.endswith(tail))
+		return re.compile(rx[:-len(tail)] + '(.*)' + tail[len('.*'):])
+
 	def base_match(self, path):
 		"""Match everything below the base glob, and return a path relative to it."""
+		prefix = self._prefix
+		if prefix is not None:
+			return path[len(prefix):] if path.startswith(prefix) else None
 		m = self.under.match(path)
 		return m.groups()[0] if m is not None else None
 
@@ -188,16 +240,20 @@ class SSHLoc:
 
 	def asdict(self):
 		"""Return parameters of `self` in the form of a :class:`dict`."""
-		return dataclasses.asdict(self)
+		return {'user': self.user, 'host': self.host, 'port': self.port}
 
 
 SSHLOC_RE = re.compile('^((?:[^/:@]*@)?\[[A-Fa-f0-9:]+\]|[^/:]*):(.*)')
 URLSCHEME_RE = re.compile('^[A-Za-z][A-Za-z0-9+.-]*://(.*)')
 
+@functools.lru_cache(maxsize=256)
 def parse_root(locstr):
 	"""
 	Parse a location string into a protocol string and btrfs root options.
 
+	Results are cached, since source lists commonly repeat locations;
+	callers must treat the returned root options as read-only.
+
 	:param locstr: the location string to parse
 	:returns: a tuple ``(protocol, root_options, root_arguments)``:
 		the protocol to pass to :func:`btrsync.sync.default_root` to obtain a root factory,
@@ -252,11 +308,13 @@ async def src_root(loc, rootopts={}, rootargs={}):
 			root = rtype(path, **rootargs)
 			matcher = UnderGlob('*')
 		else:
-			root, rpath = await rtype.get_root(posixpath.dirname(path), **rootargs)
-			matcher = SingleMatch(posixpath.join(rpath, posixpath.basename(path)))
+			vdir, vbase = posixpath.split(path)
+			root, rpath = await rtype.get_root(vdir, **rootargs)
+			matcher = SingleMatch(posixpath.join(rpath, vbase))
 	else:
-		root, rglob = await rtype.get_root(posixpath.dirname(path), **rootargs)
-		matcher = UnderGlob(posixpath.join(rglob, posixpath.basename(path)))
+		vdir, vbase = posixpath.split(path)
+		root, rglob = await rtype.get_root(vdir, **rootargs)
+		matcher = UnderGlob(posixpath.join(rglob, vbase))
 	return root, matcher
 
 
@@ -270,16 +328,12 @@ def format_transfer(volpaths, parent, destdir, *, verb=False):
 	:param verb: if :const:`True` include more details
 	:returns: formatted string
 	"""
-	vpaths = ',\n'.join(volpaths)
+	vpaths = volpaths[0] if len(volpaths) == 1 else ',\n'.join(volpaths)
 	if verb:
-		return '\n'.join((
-			'',
-			vpaths,
-			'\t' + (f'incremental from {parent}' if parent is not None else 'full'),
-			f'\tinto {destdir}',
-		))
+		kind = 'full' if parent is None else f'incremental from {parent}'
+		return f'\n{vpaths}\n\t{kind}\n\tinto {destdir}'
 	else:
-		return vpaths + '\t' + ('full' if parent is None else 'incr') + ' -> ' + destdir
+		return f"{vpaths}\t{'full' if parent is None else 'incr'} -> {destdir}"
 
 
 class Confirm(sync.ProgressTransfer):
@@ -330,6 +384,43 @@ class Confirm(sync.ProgressTransfer):
 		return r
 
 
+class CliTransfer(CliProgress):
+	"""Transfer class tailored to command-line arguments via the class attributes below."""
+	VERBOSE = False
+	QUIET = 0
+	PROGRESS = False
+
+	async def transf(self, vols, par, src, dst):
+		if self.PROGRESS:
+			await super().transf(vols, par, src, dst)
+		else:
+			await sync.Transfer.transf(self, vols, par, src, dst)
+
+	def err(self, e, *args):
+		if self.QUIET < 2:
+			print('Error:', e, file=sys.stderr)
+
+	async def report(self, vols, par, src, dst):
+		if self.QUIET:
+			return
+		volpaths, parent, _ = self._sendpaths(vols, par)
+		recvpath = self._recvpath(volpaths)
+		print(format_transfer(volpaths, parent, recvpath, verb=self.VERBOSE))
+
+	async def report_done(self, vols, par, src, dst):
+		if not self.QUIET:
+			print(" - Done")
+
+
+class CliConfirm(Confirm):
+	"""Confirm class tailored to command-line arguments via the class attributes below."""
+	QUIET = 0
+
+	def err(self, e, *args):
+		if self.QUIET < 2:
+			print('Error:', e, file=sys.stderr)
+
+
 async def do_btrsync(*, src_coros, dst_coro, incls, excls, auto,
                      confirm, syncer, syncopts, transfer, transopts):
 	"""
@@ -361,10 +452,11 @@ async def do_btrsync(*, src_coros, dst_coro, incls, excls, auto,
 		if incls is not None:
 			matcher.include(*incls)
 		matcher.exclude(*excls)
+		matcher.precompile()
 		s = syncer(sroot, droot)
 		o = {
-			'target': lambda v: matcher.match(v['path']),
-			'stop': lambda vs: matcher.stop([v['path'] for v in vs])
+			'target': matcher.match_vol,
+			'stop': matcher.stop_vols,
 		}
 		o.update(syncopts)
 		# Confirmation
@@ -390,29 +482,11 @@ def process_args(cliargs):
 	"""Process :mod:`argparse`-style output into arguments for :func:`.do_btrsync`."""
 
 	prog = cliargs.progress and not cliargs.quiet
-	class CliTransfer(CliProgress if prog else sync.Transfer):
-		"""Transfer class tailored to cli arguments."""
-		if cliargs.quiet < 2:
-			@staticmethod
-			def err(e, *args):
-				print('Error:', e, file=sys.stderr)
-
-		if not cliargs.quiet:
-			async def report(self, vols, par, src, dst):
-				volpaths, parent, _ = self._sendpaths(vols, par)
-				recvpath = self._recvpath(volpaths)
-				print(format_transfer(volpaths, parent, recvpath, verb=cliargs.verbose))
-			@staticmethod
-			async def report_done(vols, par, src, dst):
-				print(" - Done")
-
-	class CliConfirm(Confirm):
-		VERBOSE = cliargs.verbose
-
-		if cliargs.quiet < 2:
-			@staticmethod
-			def err(e, *args):
-				print('Error:', e, file=sys.stderr)
+	CliTransfer.PROGRESS = prog
+	CliTransfer.QUIET = cliargs.quiet
+	CliTransfer.VERBOSE = cliargs.verbose
+	CliConfirm.QUIET = cliargs.quiet
+	CliConfirm.VERBOSE = cliargs.verbose
 
 	transopts = {'replicate_dirs': cliargs.replicate_dirs}
 	if prog:
@@ -19,6 +19,17 @@ from . import util
 DEVNULL = asyncio.subprocess.DEVNULL
 PIPE = asyncio.subprocess.PIPE
 
+_NORET = (None, (b'', b''))
+"""Singleton result for processes that did not complete."""
+
+
+if hasattr(os, 'pipe2'):
+	def _pipe():
+		"""Create a pipe with close-on-exec set atomically."""
+		return os.pipe2(os.O_CLOEXEC)
+else:
+	_pipe = os.pipe
+
 
 def _killall(procs, forced=False):
 	for p in procs:
@@ -34,7 +45,7 @@ def _waitall(procs):
 
 async def create_pipeline(*cmds, stdin=None, stdout=None, stderr=None):
 	"""
-	Asynchronous iterator returning started subprocesses connected together as a pipeline.
+	Start subprocesses connected together as a pipeline.
 
 	:param cmds: sequence of :class:`btrsync.util.Cmd`-like commands that form the pipeline
 	:param stdin: standard input of the first command in the pipeline; :const:`None` means inherit from caller.
@@ -44,7 +55,7 @@ async def create_pipeline(*cmds, stdin=None, stdout=None, stderr=None):
 		If supplied must be file descriptor or file-like object backed by a file descriptor.
 	:param stderr: standard error of all commands in the pipeline; :const:`None` means inherit from caller
 		If supplied must be file descriptor or file-like object backed by a file descriptor.
-	:returns: :class:`asyncio.subprocess.Process` instances of started processes
+	:returns: list of :class:`asyncio.subprocess.Process` instances of started processes, in pipeline order
 	"""
 	def _chkclose(fd):
 		if fd is not None:
@@ -55,30 +66,37 @@ async def create_pipeline(*cmds, stdin=None, stdout=None, stderr=None):
 	def _fd(fd):
 		return fd if fd is None or isinstance(fd, int) else fd.fileno()
 
+	if not cmds:
+		return []
 	err = _fd(stderr)
-	end = stdin
-	for prg, args in cmds[:-1]:
-		try:
-			nextend, head = os.pipe()
-		except:
-			_chkclose(end)
-			raise
-		try:
-			proc = await asyncio.create_subprocess_exec(prg, *args, stdin=_fd(end), stdout=head, stderr=err)
-		except:
-			os.close(nextend)
-			raise
-		finally:
-			_chkclose(end)
-			os.close(head)
-		yield proc
-		end = nextend
-	for prg, args in cmds[-1:]:
-		try:
-			proc = await asyncio.create_subprocess_exec(prg, *args, stdin=_fd(end), stdout=_fd(stdout), stderr=err)
-		finally:
-			_chkclose(end)
-		yield proc
+	pipes = []
+	try:
+		for _ in cmds[1:]:
+			pipes.append(_pipe())
+	except:
+		for r, w in pipes:
+			os.close(r)
+			os.close(w)
+		_chkclose(stdin)
+		raise
+	ends = [stdin] + [r for r, _ in pipes]
+	heads = [w for _, w in pipes] + [_fd(stdout)]
+	spawns = (asyncio.create_subprocess_exec(prg, *args, stdin=_fd(end), stdout=head, stderr=err)
+	          for (prg, args), end, head in zip(cmds, ends, heads))
+	try:
+		rets = await asyncio.gather(*spawns, return_exceptions=True)
+	finally:
+		_chkclose(stdin)
+		for r, w in pipes:
+			os.close(r)
+			os.close(w)
+	procs = [p for p in rets if not isinstance(p, BaseException)]
+	for e in rets:
+		if isinstance(e, BaseException):
+			_killall(procs)
+			await _waitall(procs)
+			raise e
+	return procs
 
 
 async def wait_procs(procs, *, timeout=None, abort=False):
@@ -90,22 +108,27 @@ async def wait_procs(procs, *, timeout=None, abort=False):
 	:param abort: if :const:`True`, terminate remaining running processes after an abnormal completion (exit code not 0)
 	:returns: a list of tuples ``(process, output)``, in order of completion, of process objects and their captured ``(stdout, stderr)`` output, if any
 	"""
-	def _wrapproc(p):
-		async def pwait():
-			r = await p.communicate()
-			return p, r
-		return pwait()
-
+	tasks = {asyncio.create_task(p.communicate()): p for p in procs}
 	rets = []
-	for coro in asyncio.as_completed([_wrapproc(p) for p in procs], timeout=timeout):
-		try:
-			res = await coro
-		except TimeoutError:
+	pending = set(tasks)
+	loop = asyncio.get_running_loop()
+	deadline = None if timeout is None else loop.time() + timeout
+	while pending:
+		remaining = None
+		if deadline is not None:
+			remaining = deadline - loop.time()
+			if remaining <= 0:
+				break
+		done, pending = await asyncio.wait(pending, timeout=remaining,
+		                                   return_when=asyncio.FIRST_COMPLETED)
+		if not done:
 			break
-		rets.append(res)
-		if abort and res.returncode:
-			_killall(procs)
-			abort = False
+		for t in done:
+			p = tasks[t]
+			rets.append((p, t.result()))
+			if abort and p.returncode:
+				_killall(procs)
+				abort = False
 	return rets
 
 
@@ -124,15 +147,7 @@ async def ex(*cmds, stdin=None, stdout=None, stderr=None,
 	:returns: a tuple ``(procs, rets)``: a list of spawned :class:`asyncio.subprocess.Process` objects, in the order specified by `cmds`, and
 		      a list of tuples ``(process, output)``, in order of completion, of process objects and their captured ``(stdout, stderr)`` output, if any
 	"""
-	procs = []
-	try:
-		async for p in create_pipeline(*cmds, stdin=stdin, stdout=stdout, stderr=stderr):
-			procs.append(p)
-	except:
-		_killall(procs)
-		await _waitall(procs)
-		raise
-
+	procs = await create_pipeline(*cmds, stdin=stdin, stdout=stdout, stderr=stderr)
 	try:
 		r = await wait_procs(procs, timeout=timeout, **kwargs)
 	except:
@@ -154,5 +169,5 @@ async def ex_out(*cmds, stdout=PIPE, **kwargs):
 	:returns: a list of tuples ``(exit_code, output)``, in the order specified by `cmds`, of the processes' exit code and captured ``(stdout, stderr)`` output
 	"""
 	proc, ret = await ex(*cmds, stdout=stdout, stderr=PIPE, hard_timeout=True, **kwargs)
-	rv = {r[0]: (r[0].returncode, r[1]) for r in ret}
-	return [rv[p] if p in rv else (None, (b'', b'')) for p in proc]
+	rv = {p: (p.returncode, out) for p, out in ret}
+	return [rv.get(p, _NORET) for p in proc]
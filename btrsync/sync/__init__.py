@@ -10,11 +10,33 @@ Btrfs subvolume synchronization.
 """
 
 import asyncio
+import operator
 import posixpath
 import itertools
 
+from collections import deque
+
 from .. import btrfs
-from .. import util
+
+
+_vol_path = operator.itemgetter('path')
+_vol_uuid = operator.itemgetter('uuid')
+
+
+def install_fast_loop():
+	"""
+	Install the ``uvloop`` event loop policy, if available.
+
+	Purely opt-in: ``uvloop`` is not a dependency, and its absence leaves the default policy untouched.
+
+	:returns: :const:`True` if the policy was installed, :const:`False` if ``uvloop`` is unavailable
+	"""
+	try:
+		import uvloop
+	except ImportError:
+		return False
+	asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+	return True
 
 
 class BtrSync:
@@ -30,23 +52,35 @@ class BtrSync:
 	Two subvolumes are considered equal if any of their key values compare equal and are not :const:`None`.
 	The default key functions return the UUID and received UUID of subvolumes.
 	"""
-	DEFAULT_KEYS = (lambda v: v['uuid'], lambda v: v['received_uuid'])
+	DEFAULT_KEYS = (operator.itemgetter('uuid'), operator.itemgetter('received_uuid'))
 	def __init__(self, src, dst, *, srckeys=None, dstkeys=None):
 		self.src = src
 		self.dst = dst
 		self.srckeys = srckeys if srckeys is not None else self.DEFAULT_KEYS
 		self.dstkeys = dstkeys if dstkeys is not None else self.DEFAULT_KEYS
+		self.srcroots = None
+		self.dstroots = None
+		self.diff = None
+		self._difftok = None
+		self._synced = set()
 
 	@staticmethod
 	def volgroups(roots):
 		"""Iterate over `roots` and their descendants in groups of COW-independent volumes."""
 		g = []
+		append = g.append
 		for vol in btrfs.COWTree.bfs(*roots, depth_markers=True):
 			if vol is None:
 				yield g
 				g = []
+				append = g.append
 			else:
-				g.append(vol)
+				append(vol)
+
+	@staticmethod
+	def _listtok(roots):
+		"""Order-insensitive fingerprint of a root listing, keyed on subvolume uuid and generation."""
+		return frozenset((v['uuid'], v.get('generation')) for v in btrfs.COWTree.bfs(*roots))
 
 	@staticmethod
 	def target(vol):
@@ -55,9 +89,13 @@ class BtrSync:
 
 	def parent(self, vol):
 		"""Return the COW parent of `vol` to be used as basis for incremental send, or :const:`None` if unavailable."""
-		for par in btrfs.COWTree.ancestors(vol):
-			if par['uuid'] in self.diff[0]:
-				return par
+		present = self.diff[0]
+		synced = self._synced
+		while vol is not None:
+			uid = vol['uuid']
+			if uid in present or uid in synced:
+				return vol
+			vol = vol.parent
 		return None
 
 	@staticmethod
@@ -70,13 +108,25 @@ class BtrSync:
 		"""Called after `vols` have been synced; return :const:`True` if sync should immediately stop."""
 		return False
 
-	async def _refresh(self, trans):
-		"""Update the internal diff between source and destination roots."""
+	async def _refresh(self, trans, *, force=True):
+		"""
+		Update the internal diff between source and destination roots.
+
+		If `force` is :const:`False` and listings from a previous refresh exist, reuse them;
+		the diff is kept current across syncs by :meth:`sync` marking transferred volumes.
+		"""
+		if not force and self.diff is not None:
+			return
 		self.srcroots, self.dstroots = await trans.try_gather(self.src.list(), self.dst.list())
+		self._synced = set()
+		tok = (self._listtok(self.srcroots), self._listtok(self.dstroots))
+		if tok == self._difftok and self.diff is not None:
+			return
 		self.diff = btrfs.COWTree.diff(self.srcroots, self.dstroots, self.srckeys, self.dstkeys)
+		self._difftok = tok
 
-	async def sync(self, trans, *, batch=False, parallel=False, transfer_existing=False,
-	               volgroups=None, target=None, parent=None, check=None, stop=None):
+	async def sync(self, trans, *, batch=False, parallel=False, prefetch=1, transfer_existing=False,
+	               refresh=True, volgroups=None, target=None, parent=None, check=None, stop=None):
 		"""
 		Perform synchronization of subvolumes.
 
@@ -85,7 +135,11 @@ class BtrSync:
 		:param trans: :class:`.Transfer`-like object to perform the actual send/receive operations
 		:param batch: if :const:`True`, batch together multiple volumes into a single transfer
 		:param parallel: if :const:`True`, run independent transfers in parallel
+		:param prefetch: number of sequential transfers allowed in flight at once; values above 1
+			overlap the setup of upcoming transfers with the tail of the current one (ignored if `parallel`)
 		:param transfer_existing: if :const:`True`, consider for transfer volumes that already exist on the destination
+		:param refresh: if :const:`False`, reuse the root listings and diff from a previous sync on this instance
+			instead of re-enumerating both roots
 		:param volgroups: override for :meth:`volgroups`
 		:param target: override for :meth:`target`
 		:param parent: override for :meth:`parent`
@@ -98,6 +152,9 @@ class BtrSync:
 		parent = self.parent if parent is None else parent
 		check = self.check if check is None else check
 		stop = self.stop if stop is None else stop
+		no_target = target is BtrSync.target
+		no_check = check is BtrSync.check
+		no_stop = stop is BtrSync.stop
 
 		def tf(vols, par):
 			async def f(a):
@@ -106,41 +163,71 @@ class BtrSync:
 			return f(trans.transf(vols, par, self.src, self.dst))
 
 		def mark(vols):
-			for v in vols:
-				self.diff[0][v['uuid']].append(None)
+			self._synced.update(map(_vol_uuid, vols))
 
-		await self._refresh(trans)
+		def pipelined(transfers):
+			pend = deque()
+			try:
+				for t in transfers:
+					pend.append(asyncio.create_task(t))
+					if len(pend) >= prefetch:
+						yield pend.popleft()
+				while pend:
+					yield pend.popleft()
+			finally:
+				for t in pend:
+					t.cancel()
+
+		await self._refresh(trans, force=refresh)
 		finish = False
 		erred = False
 		for volgr in volgroups(self.srcroots):
-			targets = [vol for vol in volgr if target(vol) and (transfer_existing or vol['uuid'] not in self.diff[0])]
-			parents = (parent(vol) for vol in targets)
-			cand = (pair for pair in zip(targets, parents) if check(*pair))
+			diff0 = self.diff[0]
+			synced = self._synced
+			cand = []
+			for vol in volgr:
+				if not no_target and not target(vol):
+					continue
+				uid = vol['uuid']
+				if not transfer_existing and (uid in diff0 or uid in synced):
+					continue
+				par = parent(vol)
+				if no_check or check(vol, par):
+					cand.append((vol, par))
 			if batch:
-				packs = (
-					([x[0] for x in vps], vps[0][1])
-					for _, vps in util.group(
-						cand,
-						lambda x: (x[1]['uuid'] if x[1] is not None else None, posixpath.dirname(x[0]))
-					)[0].items()
-				)
+				_dirname = posixpath.dirname
+				groups = {}
+				for vol, par in cand:
+					key = (par['uuid'] if par is not None else None, _dirname(vol['path']))
+					groups.setdefault(key, ([], par))[0].append(vol)
+				packs = groups.values()
 			else:
 				packs = (([x[0]], x[1]) for x in cand)
 			transfers = (tf(vols, par) for vols, par in packs)
-			transeq = asyncio.as_completed(transfers) if parallel else transfers
-			for transop in transeq:
-				try:
-					vols, res = await transop
-				except asyncio.CancelledError:
-					erred = True
-					if parallel:
-						continue
-					else:
+			if parallel:
+				pending = {asyncio.ensure_future(t) for t in transfers}
+				while pending:
+					done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+					for t in done:
+						try:
+							vols, res = t.result()
+						except asyncio.CancelledError:
+							erred = True
+							continue
+						mark(vols)
+						if not no_stop and stop(vols):
+							finish = True
+			else:
+				transeq = pipelined(transfers) if prefetch > 1 else transfers
+				for transop in transeq:
+					try:
+						vols, res = await transop
+					except asyncio.CancelledError:
+						erred = True
 						break
-				mark(vols)
-				if stop(vols):
-					finish = True
-					if not parallel:
+					mark(vols)
+					if not no_stop and stop(vols):
+						finish = True
 						break
 			if finish or erred:
 				break
@@ -157,6 +244,7 @@ class Transfer:
 	def __init__(self, *, recvpath='.', replicate_dirs=False):
 		self.recvbase = recvpath
 		self.replicate_dirs = replicate_dirs
+		self._join_cache = {}
 
 	def err(self, e, *args):
 		"""Called on encountering an exception `e`; expected to log the error and return successfully."""
@@ -183,14 +271,12 @@ class Transfer:
 			raise asyncio.CancelledError() from e
 
 	async def _collect(self, *tasks):
-		erred = False
 		for t in tasks:
-			try:
-				await asyncio.wait_for(t, timeout=0)
-			except TimeoutError:
-				pass
-			except BaseException as e:
-				self.err(e)
+			t.cancel()
+		erred = False
+		for r in await asyncio.gather(*tasks, return_exceptions=True):
+			if isinstance(r, BaseException) and not isinstance(r, asyncio.CancelledError):
+				self.err(r)
 				erred = True
 		if erred:
 			raise asyncio.CancelledError()
@@ -203,20 +289,26 @@ class Transfer:
 
 		:raises asyncio.CancelledError: if any tasks raise an exception
 		"""
-		tasks = map(asyncio.create_task, coroutines)
+		tasks = [asyncio.create_task(c) for c in coroutines]
 		try:
 			return await asyncio.gather(*tasks)
 		except BaseException as e:
 			self.err(e)
-			try:
-				await self._collect(*tasks)
-			except asyncio.CancelledError:
-				pass
+			for t in tasks:
+				t.cancel()
+			for t in tasks:
+				try:
+					await t
+				except asyncio.CancelledError:
+					pass
+				except BaseException as e2:
+					if e2 is not e:
+						self.err(e2)
 			raise asyncio.CancelledError() from e
 
 	@staticmethod
 	def _sendpaths(vols, par):
-		volpaths = [v['path'] for v in vols]
+		volpaths = list(map(_vol_path, vols))
 		parent = par['path'] if par is not None else None
 		meta = {'volumes': volpaths}
 		if parent is not None:
@@ -226,9 +318,14 @@ class Transfer:
 	def _recvpath(self, volpaths):
 		if self.replicate_dirs:
 			voldir = posixpath.dirname(volpaths[0])
-			for vp in volpaths[1:]:
-				assert(posixpath.dirname(vp) == voldir)
-			return posixpath.join(self.recvbase, voldir)
+			if __debug__:
+				for vp in volpaths[1:]:
+					assert(posixpath.dirname(vp) == voldir)
+			try:
+				return self._join_cache[voldir]
+			except KeyError:
+				p = self._join_cache[voldir] = posixpath.join(self.recvbase, voldir)
+				return p
 		else:
 			return self.recvbase
 
@@ -243,12 +340,18 @@ class Transfer:
 		:raises asyncio.CancelledError: if any error has occured, after logging it with :meth:`err`
 		"""
 		args = (vols, par, src, dst)
-		await self.try_await(self.report(*args))
-		volpaths, parent, meta = self._sendpaths(vols, par)
-		flow, scoro = await self.try_await(src.send(*volpaths, parent=parent))
-		dcoro = await self.try_await(dst.receive(flow, self._recvpath(volpaths), meta=meta))
-		await self.try_gather(scoro, dcoro, flow.pump())
-		await self.try_await(self.report_done(*args))
+		try:
+			await self.report(*args)
+			volpaths, parent, meta = self._sendpaths(vols, par)
+			flow, scoro = await src.send(*volpaths, parent=parent)
+			dcoro = await dst.receive(flow, self._recvpath(volpaths), meta=meta)
+			await self.try_gather(scoro, dcoro, flow.pump())
+			await self.report_done(*args)
+		except asyncio.CancelledError:
+			raise
+		except BaseException as e:
+			self.err(e)
+			raise asyncio.CancelledError() from e
 
 
 class ProgressTransfer(Transfer):
@@ -275,13 +378,16 @@ class ProgressTransfer(Transfer):
 
 	async def progress(self, flow, seq):
 		"""Implement progress reporting every `period` seconds."""
+		report = self.report_progress
+		period = self.period
+		sleep = asyncio.sleep
 		cnt, prev = flow.count, 0
 		while True:
-			await self.report_progress(cnt, prev, seq)
+			await report(cnt, prev, seq)
 			try:
-				await asyncio.sleep(self.period)
+				await sleep(period)
 			except:
-				await self.report_progress(flow.count, cnt, seq)
+				await report(flow.count, cnt, seq)
 				raise
 			cnt, prev = flow.count, cnt
 
@@ -297,17 +403,23 @@ class ProgressTransfer(Transfer):
 		"""
 		args = (vols, par, src, dst)
 		seq = itertools.cycle(self.prog_seq)
-		volpaths, parent, meta = self._sendpaths(vols, par)
-		await self.try_await(self.report(*args))
-		flow, scoro = await self.try_await(src.send(*volpaths, parent=parent))
-		flow.stats = True
-		dcoro = await self.try_await(dst.receive(flow, self._recvpath(volpaths), meta=meta))
-		prog = asyncio.create_task(self.progress(flow, seq))
 		try:
-			await self.try_gather(scoro, dcoro, flow.pump())
-		finally:
-			await self._collect(prog)
-		await self.try_await(self.report_done(*args))
+			volpaths, parent, meta = self._sendpaths(vols, par)
+			await self.report(*args)
+			flow, scoro = await src.send(*volpaths, parent=parent)
+			flow.stats = True
+			dcoro = await dst.receive(flow, self._recvpath(volpaths), meta=meta)
+			prog = asyncio.create_task(self.progress(flow, seq))
+			try:
+				await self.try_gather(scoro, dcoro, flow.pump())
+			finally:
+				await self._collect(prog)
+			await self.report_done(*args)
+		except asyncio.CancelledError:
+			raise
+		except BaseException as e:
+			self.err(e)
+			raise asyncio.CancelledError() from e
 
 
 from . import root
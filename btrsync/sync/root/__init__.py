@@ -25,8 +25,13 @@ class BtrfsRoot(abc.ABC):
 	_kwargs = ()
 
 	def _reprargs(self):
-		return ', '.join((', '.join(f'{repr(getattr(self, arg))}' for arg in self._args),
-		                  ', '.join(f'{arg}={repr(getattr(self, arg))}' for arg in self._kwargs)))
+		cls = type(self)
+		tmpl = cls.__dict__.get('_REPR_TMPL')
+		if tmpl is None:
+			tmpl = ', '.join(['{!r}'] * len(self._args) + [f'{arg}={{!r}}' for arg in self._kwargs])
+			cls._REPR_TMPL = tmpl
+		return tmpl.format(*(getattr(self, arg) for arg in self._args),
+		                   *(getattr(self, arg) for arg in self._kwargs))
 
 	def __repr__(self):
 		return f'{type(self).__name__}({self._reprargs()})'
@@ -12,6 +12,7 @@ Btrfs roots implemented using local file I/O.
 import os
 import posixpath
 import uuid
+import weakref
 
 from . import BtrfsRoot
 from . import _exec
@@ -20,6 +21,15 @@ from ... import util
 from ... import btrfs
 
 
+def _fadvise_seq(fd):
+	"""Advise the kernel of sequential, single-pass reads on `fd`, where supported."""
+	try:
+		os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+		os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_NOREUSE)
+	except (AttributeError, OSError):
+		pass
+
+
 class _FileRoot(BtrfsRoot):
 	@staticmethod
 	async def _nop():
@@ -69,6 +79,14 @@ class FileRecvRoot(_FileRoot, _exec.ExecBtrfsRoot):
 		self._kwargs = ('subroot', 'create_recvpath', 'namer', 'dump_pipe', 'ext')
 		if namer is not None:
 			self._namer = namer
+		self._dirfd = None
+		if rootpath is not None and {os.open, os.mkdir} <= os.supports_dir_fd:
+			try:
+				self._dirfd = os.open(rootpath, os.O_DIRECTORY | os.O_CLOEXEC)
+			except OSError:
+				pass
+			else:
+				weakref.finalize(self, os.close, self._dirfd)
 
 	@staticmethod
 	def _namer(meta):
@@ -104,16 +122,33 @@ class FileRecvRoot(_FileRoot, _exec.ExecBtrfsRoot):
 		finally:
 			f.close()
 
+	def _openat(self, path, fn):
+		"""Open `fn` for writing under `path`, resolving relative to the cached root directory fd."""
+		if self.create_recvpath and path not in ('', '.'):
+			cur = ''
+			for comp in path.split(os.sep):
+				cur = os.path.join(cur, comp) if cur else comp
+				try:
+					os.mkdir(cur, dir_fd=self._dirfd)
+				except FileExistsError:
+					pass
+		fd = os.open(os.path.join(path, fn), os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC,
+		             0o666, dir_fd=self._dirfd)
+		return open(fd, 'wb', buffering=0)
+
 	async def receive(self, flow, path='.', *, meta={}):
 		if self.rootpath is None:
 			pin = flow.connect_fd()
 			return self._run_checked(*util.Cmd.pipeline(self.dump_pipe), stdin=pin, stdout=None)
 		else:
 			fn = self._namer(meta) + self.ext
-			odir = os.path.join(self.rootpath, path)
-			if self.create_recvpath:
-				os.makedirs(odir, exist_ok=True)
-			ofile = open(os.path.join(odir, fn), 'wb', buffering=0)
+			if self._dirfd is not None:
+				ofile = self._openat(path, fn)
+			else:
+				odir = os.path.join(self.rootpath, path)
+				if self.create_recvpath:
+					os.makedirs(odir, exist_ok=True)
+				ofile = open(os.path.join(odir, fn), 'wb', buffering=0)
 			if self.dump_pipe:
 				pin = flow.connect_fd()
 				return self._runclose(
@@ -136,10 +171,11 @@ class FileSendRoot(_FileRoot):
 	def __init__(self, rootpath):
 		self.rootpath = rootpath
 		self._args = ('rootpath',)
+		self._uuid = str(uuid.uuid4())
 
 	async def list(self):
-		"""No-op; return a single volume with path `rootpath` and a random uuid."""
-		return [btrfs.Vol(path=self.rootpath, uuid=str(uuid.uuid4()), received_uuid=None)]
+		"""No-op; return a single volume with path `rootpath` and a per-instance random uuid."""
+		return [btrfs.Vol(path=self.rootpath, uuid=self._uuid, received_uuid=None)]
 
 	async def show(self, path='.'):
 		"""No-op; return `rootpath` and empty properties."""
@@ -148,7 +184,9 @@ class FileSendRoot(_FileRoot):
 	async def send(self, *paths, parent=None, clones=[]):
 		if len(paths) > 1 or paths[0] != self.rootpath:
 			raise ValueError(f'Cannot send path other than {self.rootpath}')
-		return util.FileFlow(open(self.rootpath, 'rb', buffering=0)), self._nop()
+		f = open(self.rootpath, 'rb', buffering=0)
+		_fadvise_seq(f.fileno())
+		return util.FileFlow(f), self._nop()
 
 	async def receive(self, flow, path='.', *, meta={}):
 		"""Not implemented; raises :exc:`NotImplementedError`."""
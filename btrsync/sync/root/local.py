@@ -11,6 +11,7 @@ Btrfs roots implemented using locally executed ``btrfs`` commands.
 
 import io
 import os
+import time
 import asyncio
 import posixpath
 
@@ -24,6 +25,11 @@ from ... import cmdex
 
 SUDO = util.Cmd('sudo')
 
+_FSROOT_CACHE = {}
+"""Cache of filesystem root probe results, keyed by ``(root class, rootpath)``."""
+_FSROOT_TTL = 60
+"""Seconds before a cached filesystem root probe is considered stale."""
+
 
 class LocalBtrfsRoot(_exec.ExecBtrfsRoot):
 	"""
@@ -60,8 +66,8 @@ class LocalBtrfsRoot(_exec.ExecBtrfsRoot):
 	async def is_root(cls, path):
 		cmd = btrfs.cmd.show(path)
 		ret, (stdout, stderr) = await cls._run(cmd, stdin=cmdex.DEVNULL)
-		err = stderr.decode('utf-8')
 		if ret != 0:
+			err = stderr.decode('utf-8')
 			if 'Not a Btrfs subvolume' in err or 'No such file or directory' in err:
 				return False
 			else:
@@ -71,12 +77,23 @@ class LocalBtrfsRoot(_exec.ExecBtrfsRoot):
 
 	@classmethod
 	async def get_root(cls, path, **kwargs):
-		rpath = path
-		while rpath != '/' and not await cls.is_root(rpath):
-			rpath = os.path.dirname(rpath)
-		if rpath == '/' and not await cls.is_root(rpath):
-			raise BtrfsError('Cannot find root')
-		return cls(rpath, **kwargs), os.path.relpath(path, rpath)
+		cands = [path]
+		while cands[-1] != '/':
+			head = os.path.dirname(cands[-1])
+			if not head or head == cands[-1]:
+				break
+			cands.append(head)
+		sem = asyncio.Semaphore(8)
+		async def probe(p):
+			async with sem:
+				return await cls.is_root(p)
+		results = await asyncio.gather(*(probe(p) for p in cands), return_exceptions=True)
+		for rpath, r in zip(cands, results):
+			if isinstance(r, BaseException):
+				raise r
+			if r:
+				return cls(rpath, **kwargs), os.path.relpath(path, rpath)
+		raise BtrfsError('Cannot find root')
 
 	def _localpath(self, path):
 		if not util.is_subpath(path):
@@ -85,21 +102,32 @@ class LocalBtrfsRoot(_exec.ExecBtrfsRoot):
 
 	async def _chk(self):
 		if self._fsroot is None:
+			key = (type(self), self.rootpath)
+			cached = _FSROOT_CACHE.get(key)
+			if cached is not None and time.monotonic() - cached[1] < _FSROOT_TTL:
+				self._fsroot = cached[0]
+				return
 			ret, (stdout, stderr) = await self._run_checked(btrfs.cmd.show(self.rootpath), stdin=cmdex.DEVNULL)
 			rp, stats = btrfs.parse.Show.from_stdout(stdout)
 			self._fsroot = posixpath.join(btrfs.FSTREE, '' if rp == '/' else rp)
+			_FSROOT_CACHE[key] = (self._fsroot, time.monotonic())
 
 	async def list(self):
-		await self._chk()
 		alcmd = btrfs.cmd.list(self.rootpath, list_all=not self._isolated, readonly=False, fields='uqR')
 		rocmd = btrfs.cmd.list(self.rootpath, list_all=not self._strict, readonly=self.readonly, fields='u')
 
-		ret, (stdout, stderr) = await self._run_checked(rocmd, stdin=cmdex.DEVNULL)
-		rvs = util.index(btrfs.parse.List.from_stdout(stdout), lambda v: v['uuid'])[0]
-		ret, (stdout, stderr) = await self._run_checked(alcmd, stdin=cmdex.DEVNULL)
-		allvols = btrfs.relpaths(btrfs.parse.List.from_stdout(stdout), self._fsroot)
-
-		ct = btrfs.COWTree(allvols, lambda v: v['uuid'] in rvs and not v['path'].startswith(btrfs.FSTREE))
+		_, rores, alres = await asyncio.gather(
+			self._chk(),
+			self._run_checked(rocmd, stdin=cmdex.DEVNULL),
+			self._run_checked(alcmd, stdin=cmdex.DEVNULL),
+		)
+		ret, (stdout, stderr) = rores
+		rvs = frozenset(v['uuid'] for v in btrfs.parse.List.from_stdout(stdout))
+		ret, (stdout, stderr) = alres
+		allvols = btrfs.relpaths(btrfs.parse.List.from_stdout(stdout), self._fsroot, inplace=True)
+
+		fstree = btrfs.FSTREE
+		ct = btrfs.COWTree(allvols, lambda v: v['uuid'] in rvs and not v['path'].startswith(fstree))
 		return ct.roots
 
 	async def show(self, path='.'):
@@ -114,7 +142,7 @@ class LocalBtrfsRoot(_exec.ExecBtrfsRoot):
 			parent = self._localpath(parent)
 		clones = (self._localpath(c) for c in clones)
 		await self._chk()
-		r, w = map(io.FileIO, os.pipe(), ('r', 'w'))
+		r, w = map(io.FileIO, util._pipe(), ('r', 'w'))
 		return util.PipeFlow(r), self._dosend(w, btrfs.cmd.send(*tpaths, parent=parent, clones=clones))
 
 	async def _dosend(self, f, cmd):
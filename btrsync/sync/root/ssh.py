@@ -14,7 +14,7 @@ from . import local
 from ... import util
 
 
-def SSHRoot(host, *, user=None, port=None, pkpath=None, compress=False, sudo=False):
+def SSHRoot(host, *, user=None, port=None, pkpath=None, compress=False, sudo=False, multiplex=True):
 	"""
 	Return an appropriate btrfs root class for accessing btrfs filesystems on remote machines using ssh.
 
@@ -24,11 +24,17 @@ def SSHRoot(host, *, user=None, port=None, pkpath=None, compress=False, sudo=Fal
 	:param pkpath: the local path to the private key (identity) file to use
 	:param compress: if :const:`True`, enable compression on the ssh channel
 	:param sudo: if :const:`True`, use ``sudo`` to execute ``btrfs`` commands on the remote machine
+	:param multiplex: if :const:`True`, share one ssh connection across invocations via ControlMaster;
+		falls back to separate connections if the control socket cannot be set up
 	"""
 	_rargs = {'host': host, 'user': user, 'port': port, 'pkpath': pkpath, 'compress': compress, 'sudo': sudo}
 	args = []
 	if compress:
 		args.append('-C')
+	if multiplex:
+		args.extend(('-o', 'ControlMaster=auto',
+		             '-o', 'ControlPath=~/.ssh/btrsync-%C.sock',
+		             '-o', 'ControlPersist=60s'))
 	if user is not None:
 		args.extend(('-l', user))
 	if port is not None:
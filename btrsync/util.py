@@ -11,10 +11,13 @@ Various general purpose utility classes and functions.
 
 import io
 import os
+import re
 import abc
+import stat
 import shlex
+import fcntl
 import asyncio
-import itertools
+import functools
 
 from collections import deque
 from collections import namedtuple
@@ -79,12 +82,66 @@ class Flow(abc.ABC):
 		"""Direct flow to file-like object `f` that provides a file descriptor."""
 
 
-def _splice(r, w, n):
-	"""Fallback for :func:`os.splice`."""
-	d = os.read(r, n)
-	if d:
-		os.write(w, d)
-	return len(d)
+_pump_executor = None
+
+def set_pump_executor(executor):
+	"""
+	Set the executor that runs :class:`Flow` pump loops.
+
+	:param executor: a :class:`concurrent.futures.Executor`, or :const:`None` to use the event loop default
+	"""
+	global _pump_executor
+	_pump_executor = executor
+
+
+class _BufSplice:
+	"""Userland fallback for :func:`os.splice`; reads into a reusable preallocated buffer instead of allocating bytes per chunk."""
+	__slots__ = ('_buf',)
+	def __init__(self):
+		self._buf = None
+
+	def __call__(self, r, w, n):
+		buf = self._buf
+		if buf is None or len(buf) < n:
+			self._buf = buf = memoryview(bytearray(n))
+		nr = os.readv(r, (buf[:n],))
+		if nr:
+			os.write(w, buf[:nr])
+		return nr
+
+_SPLICE_FLAGS = (os.SPLICE_F_MOVE | os.SPLICE_F_MORE) if hasattr(os, 'SPLICE_F_MOVE') else 0
+
+_PIPE_BUFSZ = 1 << 20
+_F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', None)
+
+def _pipe():
+	"""Create a pipe with close-on-exec set atomically and an enlarged kernel buffer, where supported."""
+	fds = os.pipe2(os.O_CLOEXEC) if hasattr(os, 'pipe2') else os.pipe()
+	if _F_SETPIPE_SZ is not None:
+		try:
+			fcntl.fcntl(fds[1], _F_SETPIPE_SZ, _PIPE_BUFSZ)
+		except OSError:
+			pass
+	return fds
+
+def _os_splice(r, w, n):
+	"""Wrapper over :func:`os.splice` hinting the kernel to move pages and expect more data."""
+	return os.splice(r, w, n, flags=_SPLICE_FLAGS)
+
+def _os_sendfile(r, w, n):
+	"""Wrapper over :func:`os.sendfile` for file-backed sources where :func:`os.splice` does not apply."""
+	return os.sendfile(w, r, None, n)
+
+def _os_copy_range(r, w, n):
+	"""Wrapper over :func:`os.copy_file_range` for transfers between regular files."""
+	return os.copy_file_range(r, w, n)
+
+def _both_regular(r, w):
+	"""Return whether `r` and `w` are both file descriptors of regular files."""
+	try:
+		return stat.S_ISREG(os.fstat(r).st_mode) and stat.S_ISREG(os.fstat(w).st_mode)
+	except OSError:
+		return False
 
 
 class _FdFlow(Flow):
@@ -107,27 +164,40 @@ class _FdFlow(Flow):
 		except BrokenPipeError:
 			return 0
 		except AttributeError:
+			if _both_regular(r, w):
+				try:
+					rv = _os_copy_range(r, w, n)
+					self._spl = _os_copy_range
+					return rv
+				except (AttributeError, OSError):
+					pass
 			try:
-				r = os.splice(r, w, n)
-				self._spl = os.splice
+				rv = _os_splice(r, w, n)
+				self._spl = _os_splice
 			except (AttributeError, OSError):
-				r = _splice(r, w, n)
-				self._spl = _splice
-			return r
+				try:
+					rv = _os_sendfile(r, w, n)
+					self._spl = _os_sendfile
+				except (AttributeError, OSError):
+					spl = _BufSplice()
+					rv = spl(r, w, n)
+					self._spl = spl
+			return rv
 
 	async def _pipe_pump(self, r, w):
 		"""Byte pump reading from `r` into `w` and tallying the byte count into :attr:`count`."""
 		def fdpump(r, w):
-			NBYTES = 2**20
+			NBYTES = 1 << 22
 			c = 0
+			splice = self._splice
 			while True:
-				n = self._splice(r, w, NBYTES)
+				n = splice(r, w, NBYTES)
 				if not n:
 					break
 				c += n
 				self._count = c
 		try:
-			await asyncio.to_thread(fdpump, r.fileno(), w.fileno())
+			await asyncio.get_running_loop().run_in_executor(_pump_executor, fdpump, r.fileno(), w.fileno())
 		finally:
 			r.close()
 			w.close()
@@ -148,7 +218,7 @@ class PipeFlow(_FdFlow):
 
 	def connect_pipe(self):
 		if self.stats:
-			r, w = map(io.FileIO, os.pipe(), ('r', 'w'))
+			r, w = map(io.FileIO, _pipe(), ('r', 'w'))
 			self._pump = self._pipe_pump(self._f, w)
 			self._count = 0
 			return r
@@ -171,21 +241,37 @@ class FileFlow(_FdFlow):
 			return self._f
 
 	def connect_pipe(self):
-		r, w = map(io.FileIO, os.pipe(), ('r', 'w'))
+		r, w = map(io.FileIO, _pipe(), ('r', 'w'))
 		self._pump = self._pipe_pump(self._f, w)
 		self._count = 0
 		return r
 
 
+_SAFE_TOKEN = re.compile(r'\A[A-Za-z0-9_\-./=:+]+\Z').match
+"""Matcher for tokens that need no shell quoting."""
+
+_NEEDS_LEX = re.compile(r'''["'\\#]''').search
+"""Matcher for command strings requiring a full shell lexer."""
+
+@functools.lru_cache(maxsize=4096)
+def _parse_cmdstr(cmd):
+	"""Parse a shell command string into a ``(program, arguments)`` tuple, caching results."""
+	if _NEEDS_LEX(cmd) is None:
+		prg, *args = cmd.split()
+	else:
+		s = shlex.shlex(cmd, posix=True)
+		s.whitespace_split = True
+		prg, *args = s
+	return prg, tuple(args)
+
+
 class Cmd(namedtuple('Cmd', ['prg', 'args'], defaults=((),))):
 	"""Convenience class for parsing shell commands to and from a ``(program, arguments)`` representation."""
 	@classmethod
 	def from_cmdstr(cls, cmd):
 		"""Parse a shell command string into a :class:`.Cmd` representation."""
-		s = shlex.shlex(cmd, posix=True)
-		s.whitespace_split = True
-		prg, *args = s
-		return cls(prg, args)
+		prg, args = _parse_cmdstr(cmd)
+		return cls(prg, list(args))
 
 	@classmethod
 	def seq(cls, seq):
@@ -196,19 +282,26 @@ class Cmd(namedtuple('Cmd', ['prg', 'args'], defaults=((),))):
 	def pipeline(cls, pipe):
 		"""Parse a shell pipeline into a sequence of :class:`.Cmd` representations."""
 		s = shlex.shlex(pipe, posix=True, punctuation_chars=' ')
-		return (cls.from_cmdstr(' '.join(toks))
-			for toks in itertools.takewhile(bool,
-				([shlex.quote(tok)
-					for tok in itertools.takewhile(lambda x: x != '|', s)]
-				for _ in itertools.count())
-			)
-		)
+		toks = []
+		for tok in s:
+			if tok == '|':
+				if not toks:
+					return
+				yield cls(toks[0], toks[1:])
+				toks = []
+			else:
+				toks.append(tok)
+		if toks:
+			yield cls(toks[0], toks[1:])
 
 	def shellify(self):
 		"""Return a properly shell-escaped command string form of `self`."""
-		tok = [shlex.quote(self.prg)]
-		tok.extend(shlex.quote(x) for x in self.args)
-		return ' '.join(tok)
+		try:
+			return self._shellstr
+		except AttributeError:
+			rv = self._shellstr = ' '.join(x if _SAFE_TOKEN(x) else shlex.quote(x)
+			                               for x in (self.prg, *self.args))
+			return rv
 
 	def pipe_arg(self, pipe):
 		"""
@@ -231,7 +324,12 @@ class Cmd(namedtuple('Cmd', ['prg', 'args'], defaults=((),))):
 		:param endmark: if not :const:`None`, append `endmark` as final argument to `outer`, after `self`
 		:returns: the new wrapped :class:`.Cmd` instance
 		"""
-		args = list(outer.args) + ([self.shellify()] if shellfmt else [self.prg] + list(self.args))
+		args = list(outer.args)
+		if shellfmt:
+			args.append(self.shellify())
+		else:
+			args.append(self.prg)
+			args.extend(self.args)
 		if endmark:
 			args.append(endmark)
 		return type(self)(outer.prg, args)
@@ -245,9 +343,11 @@ def dfs(childf, node):
 	:param node: the starting node for depth-first search
 	"""
 	stk = [node]
+	pop = stk.pop
+	extend = stk.extend
 	while stk:
-		n = stk.pop()
-		stk.extend(reversed(childf(n)))
+		n = pop()
+		extend(childf(n)[::-1])
 		yield n
 
 def bfs(childf, *nodes, maxdepth=None, depth_markers=False):
@@ -260,6 +360,14 @@ def bfs(childf, *nodes, maxdepth=None, depth_markers=False):
 	:param depth_markers: if :const:`True`, return a :const:`None` as marker after exhausting all nodes at a particular depth
 	"""
 	q = deque(nodes)
+	if maxdepth is None and not depth_markers:
+		popleft = q.popleft
+		extend = q.extend
+		while q:
+			n = popleft()
+			extend(childf(n))
+			yield n
+		return
 	q.append(None)
 	depth = 0
 	while q:
@@ -287,13 +395,14 @@ def index(seq, *keys):
 	:raises ValueError: if two elements of `seq` index to the same value for any of the `keys`
 	"""
 	rv = [{} for _ in keys]
+	pairs = tuple(zip(rv, keys))
 	for el in seq:
-		for i, key in enumerate(keys):
+		for d, key in pairs:
 			k = key(el)
-			if k in rv[i]:
+			if k in d:
 				raise ValueError(f'Duplicate index {k}')
 			else:
-				rv[i][k] = el
+				d[k] = el
 	return rv
 
 def group(seq, *keys):
@@ -305,9 +414,10 @@ def group(seq, *keys):
 	:returns: a list of dicts indexed by each key in `keys`, with values lists of elements from `seq` that share a group index
 	"""
 	rv = [defaultdict(list) for _ in keys]
+	pairs = tuple(zip(rv, keys))
 	for el in seq:
-		for i, key in enumerate(keys):
-			rv[i][key(el)].append(el)
+		for d, key in pairs:
+			d[key(el)].append(el)
 	return rv
 
 
@@ -321,16 +431,24 @@ def path_merge(a, b, *, root='/', path=os.path):
 	:param path: the path module to use (e.g. :mod:`os.path`, :mod:`posixpath`, etc.)
 	:returns: the merged path
 	"""
+	if path.isabs(b) and a and a != root:
+		raise ValueError("Can't mix absolute and relative paths")
+	curdir = path.curdir
+	bparts = [c for c in b.split(path.sep) if c and c != curdir]
 	head = a
-	tail = ''
+	tail = []
 	while head and head != root:
 		head, base = path.split(head)
-		tail = path.join(base, tail) if tail else base
-		if path.commonpath((tail, b)) == tail:
+		if base == curdir:
+			break
+		if base:
+			tail.append(base)
+		lt = len(tail)
+		if lt <= len(bparts) and tail == bparts[lt - 1::-1]:
 			return path.join(head, b)
-	else:
-		return path.join(a, b)
+	return path.join(a, b)
 
+@functools.lru_cache(maxsize=8192)
 def is_subpath(p, *, path=os.path):
 	"""
 	Determine whether `p` is a subpath, i.e., `p` is relative and does not go above its parent directory.
@@ -339,4 +457,16 @@ def is_subpath(p, *, path=os.path):
 	:param path: the path module to use (e.g. :mod:`os.path`, :mod:`posixpath`, etc.)
 	:returns: boolean whether `p` is a subpath
 	"""
-	return not(path.isabs(p) or path.normpath(p).startswith('..'))
+	if path.isabs(p):
+		return False
+	if '..' not in p:
+		return True
+	depth = 0
+	for seg in p.split(path.sep):
+		if seg == '..':
+			depth -= 1
+			if depth < 0:
+				return False
+		elif seg and seg != path.curdir:
+			depth += 1
+	return True
@@ -72,7 +72,7 @@ class TestSend(unittest.TestCase):
 	def _sanity(self, c, paths):
 		self.assertEqual(c.prg, 'btrfs')
 		self.assertEqual(c.args[0], 'send')
-		self.assertEqual(c.args[-len(paths):], list(paths))
+		self.assertEqual(tuple(c.args[-len(paths):]), tuple(paths))
 
 	def _check_clones(self, c, clones):
 		a = c.args[:]
@@ -25,6 +25,14 @@ class TestAbsPaths(unittest.TestCase):
 		for t, e in zip(btrfs.abspaths(invols, '<FS_TREE>/testvol'), exvols):
 			self.assertEqual(t, e)
 
+	def test_inplace(self):
+		invols = [{'path': 'testvol/dirpath'}]
+		out = list(btrfs.abspaths(invols, '<FS_TREE>/testvol'))
+		self.assertNotEqual(out, invols)
+		out = list(btrfs.abspaths(invols, '<FS_TREE>/testvol', inplace=True))
+		self.assertEqual(out, invols)
+		self.assertIs(out[0], invols[0])
+
 
 
 class TestRelPaths(unittest.TestCase):
@@ -42,6 +50,14 @@ class TestRelPaths(unittest.TestCase):
 		for t, e in zip(btrfs.relpaths(invols, '<FS_TREE>/testvol'), exvols):
 			self.assertEqual(t, e)
 
+	def test_inplace(self):
+		invols = [{'path': '<FS_TREE>/testvol/abs/sub'}]
+		out = list(btrfs.relpaths(invols, '<FS_TREE>/testvol'))
+		self.assertNotEqual(out, invols)
+		out = list(btrfs.relpaths(invols, '<FS_TREE>/testvol', inplace=True))
+		self.assertEqual(out, invols)
+		self.assertIs(out[0], invols[0])
+
 
 if __name__ == '__main__':
 	unittest.main()
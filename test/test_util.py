@@ -97,7 +97,7 @@ class TestCmd(unittest.TestCase):
 
 
 def _inttree(base=2, maxval=128):
-	return lambda x: [x*base + i for i in range(base)] if x < maxval else []
+	return lambda x: range(x*base, x*base + base) if x < maxval else ()
 
 
 class TestDFS(unittest.TestCase):